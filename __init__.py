@@ -1,7 +1,27 @@
+import hashlib
 import itertools
-from copy import deepcopy
+import mmap
+import os
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from collections.abc import Mapping
 import re
-from typing import Tuple, List, Optional, Dict, Union, Any
+import threading
+from typing import (
+    Tuple,
+    List,
+    Optional,
+    Dict,
+    Union,
+    Any,
+    Callable,
+    Iterator,
+    Iterable,
+    NamedTuple,
+    IO,
+)
 
 unicode_dict = {
     "Basic Latin[g]": {
@@ -2327,147 +2347,1131 @@ def print_all_unicode_chars():
 
 
 def index_all(l, n):
-    indototal = 0
     allindex = []
+    if isinstance(l, (str, bytes, bytearray)):
+        find = l.find
+        ind = find(n)
+        while ind != -1:
+            allindex.append(ind)
+            ind = find(n, ind + 1)
+        return allindex
+    ind = -1
     while True:
         try:
-            indno = l[indototal:].index(n)
-            indototal += indno + 1
-            allindex.append(indototal - 1)
+            ind = l.index(n, ind + 1)
         except ValueError:
             break
+        allindex.append(ind)
     return allindex
 
 
-def parse_elements(symb1, symb2, text):
-    textlist = list(text)
-    kla1 = sorted(index_all(textlist, symb1), reverse=True)
-    kla2 = sorted(index_all(textlist, symb2), reverse=False)
-    goodresults = []
-    aufresults = []
-    zuresults = []
-    goodresultsflat = []
-    lilen = min([len(kla1), len(kla2)])
-    oldlen = -1
-    while len(aufresults) < lilen:
-        allresultsfinal = []
-        found = False
-        for auf in sorted([uu for uu in kla1 if uu not in aufresults], reverse=True):
-            if auf in goodresultsflat:
+def map_file(path: Union[str, os.PathLike]) -> Union[mmap.mmap, bytes]:
+    """
+    Memory-maps a file read-only, so that parse_pairs scans its bytes in
+    place and the OS pages them in on demand. Returns b"" for an empty file,
+    which cannot be mapped.
+    """
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _literal_scanner(symb1, symb2):
+    if symb1 == symb2:
+        toggles = re.compile(re.escape(symb1)).finditer
+
+        def scan(text):
+            for m in toggles(text):
+                yield m.start(), m.end() - 1, None
+
+    elif len(symb1) == 1 and len(symb2) == 1:
+        bar = "|" if isinstance(symb1, str) else b"|"
+        delimiters = re.compile(re.escape(symb1) + bar + re.escape(symb2)).finditer
+
+        def scan(text):
+            for m in delimiters(text):
+                yield m.start(), m.end() - 1, m.group() == symb1
+
+    else:
+        openers = re.compile(re.escape(symb1)).finditer
+        closers = re.compile(re.escape(symb2)).finditer
+
+        def scan(text):
+            pos = 0
+            for m in openers(text):
+                for c in closers(text, pos, m.start()):
+                    yield c.start(), c.end() - 1, False
+                yield m.start(), m.end() - 1, True
+                pos = m.end()
+            for c in closers(text, pos):
+                yield c.start(), c.end() - 1, False
+
+    return scan
+
+
+def _literal_tokens(symb1, symb2, text):
+    return _literal_scanner(symb1, symb2)(text)
+
+
+class _AhoCorasick:
+    def __init__(self, words):
+        goto = [{}]
+        out = [[]]
+        for index, word in enumerate(words):
+            state = 0
+            for char in word:
+                if char not in goto[state]:
+                    goto[state][char] = len(goto)
+                    goto.append({})
+                    out.append([])
+                state = goto[state][char]
+            out[state].append(index)
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for char, child in goto[state].items():
+                queue.append(child)
+                f = fail[state]
+                while f and char not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(char, 0)
+                out[child] = out[child] + out[fail[child]]
+        self.words = words
+        self.goto = goto
+        self.fail = fail
+        self.out = out
+        if words and not isinstance(words[0], str):
+            self.skip = re.compile(
+                b"[" + b"".join(re.escape(bytes([char])) for char in goto[0]) + b"]"
+            )
+        else:
+            self.skip = re.compile(
+                "[" + "".join(re.escape(char) for char in goto[0]) + "]"
+            )
+
+    def feed(self, text, state=0):
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+        search = self.skip.search
+        hits = []
+        i = 0
+        length = len(text)
+        while i < length:
+            if not state:
+                m = search(text, i)
+                if m is None:
+                    break
+                i = m.start()
+            char = text[i]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in out[state]:
+                hits.append((i, index))
+            i += 1
+        return hits, state
+
+
+def _hit_tokens(opens, closes, len1, len2):
+    kept = []
+    free = -1
+    for start in opens:
+        if start >= free:
+            kept.append(start)
+            free = start + len1
+    if opens is closes:
+        return [(start, start + len1 - 1, None) for start in kept]
+    tokens = []
+    free = -1
+    j = 0
+    for k in range(len(kept) + 1):
+        limit = kept[k] if k < len(kept) else float("inf")
+        while j < len(closes) and closes[j] + len2 <= limit:
+            if closes[j] >= free:
+                tokens.append((closes[j], closes[j] + len2 - 1, False))
+                free = closes[j] + len2
+            j += 1
+        if k < len(kept):
+            while j < len(closes) and closes[j] < limit + len1:
+                j += 1
+            tokens.append((limit, limit + len1 - 1, True))
+            free = limit + len1
+    return tokens
+
+
+def _multipair_scanner(open_close_pairs, binary=False, encoding="utf-8"):
+    pairs = [(symb1, symb2) for symb1, symb2 in open_close_pairs if symb1 and symb2]
+    if not binary:
+        encoded = {pair: pair for pair in pairs}
+    else:
+        encoded = {
+            pair: tuple(
+                symb.encode(encoding) if isinstance(symb, str) else symb
+                for symb in pair
+            )
+            for pair in pairs
+        }
+    words = list(dict.fromkeys(symb for pair in encoded.values() for symb in pair))
+    automaton = _AhoCorasick(words) if words else None
+
+    def scan(text, **limits):
+        starts = {word: [] for word in words}
+        if automaton is not None:
+            for end, index in automaton.feed(text)[0]:
+                word = words[index]
+                starts[word].append(end - len(word) + 1)
+        return {
+            pair: PairColumns(
+                text,
+                *_nest(
+                    _hit_tokens(starts[symb1], starts[symb2], len(symb1), len(symb2)),
+                    **limits,
+                ),
+                legacy_end=True,
+            )
+            for pair, (symb1, symb2) in encoded.items()
+        }
+
+    return scan
+
+
+def _multipair_columns(open_close_pairs, text, encoding="utf-8", **limits):
+    scan = _multipair_scanner(open_close_pairs, not isinstance(text, str), encoding)
+    return scan(text, **limits)
+
+
+def _stream_tokens(chunks, symb1, symb2, encoding="utf-8"):
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        return
+    if not isinstance(first, str) and isinstance(symb1, str):
+        symb1 = symb1.encode(encoding)
+        symb2 = symb2.encode(encoding)
+    chunks = itertools.chain((first,), chunks)
+    len1 = len(symb1)
+    len2 = len(symb2)
+    opener = re.compile(re.escape(symb1))
+    closer = re.compile(re.escape(symb2))
+    toggle = symb1 == symb2
+    buffer = symb1[:0]
+    offset = 0
+    opos = cpos = 0
+    eof = False
+    while not eof:
+        chunk = next(chunks, None)
+        eof = chunk is None
+        if not eof:
+            buffer += chunk
+        length = len(buffer)
+        tokens = []
+        for m in opener.finditer(buffer, opos):
+            if not toggle:
+                for c in closer.finditer(buffer, cpos, m.start()):
+                    tokens.append((c.start(), c.end() - 1, False))
+            tokens.append((m.start(), m.end() - 1, None if toggle else True))
+            opos = cpos = m.end()
+        opos = length if eof else max(opos, length - len1 + 1)
+        if not toggle:
+            for c in closer.finditer(buffer, cpos, opos):
+                tokens.append((c.start(), c.end() - 1, False))
+                cpos = c.end()
+            # a closer starting before this point would have been found
+            # already, so the text in front of it need not be kept
+            cpos = max(cpos, opos - len2 + 1)
+        for start, last, is_open in tokens:
+            yield start + offset, last + offset, is_open
+        cut = min(opos, cpos) if not toggle else opos
+        buffer = buffer[cut:]
+        offset += cut
+        opos -= cut
+        cpos -= cut
+
+
+def _compact(starts, ends, parents):
+    keep = [i for i, end in enumerate(ends) if end >= 0]
+    remap = [-1] * len(ends)
+    for new, old in enumerate(keep):
+        remap[old] = new
+    starts = array("q", (starts[i] for i in keep))
+    ends = array("q", (ends[i] for i in keep))
+    parents = array("q", (remap[parents[i]] if parents[i] >= 0 else -1 for i in keep))
+    depths = array("q", (0 for _ in keep))
+    for i, parent in enumerate(parents):
+        if parent >= 0:
+            depths[i] = depths[parent] + 1
+    return starts, ends, parents, depths
+
+
+def _nest(tokens, max_depth=None, max_matches=None, innermost_only=False):
+    starts = array("q")
+    ends = array("q")
+    parents = array("q")
+    depths = array("q")
+    has_child = bytearray()
+    seen = [] if max_depth is not None else None
+    stack = []
+    closed = 0
+    for token in tokens:
+        if seen is not None:
+            seen.append(token)
+        start, last, is_open = token
+        if is_open or (is_open is None and not stack):
+            if max_depth is not None and len(stack) > max_depth:
+                stack.append(-1)
                 continue
-            for zu in sorted([uu for uu in kla2 if uu not in zuresults], reverse=False):
-                if zu in goodresultsflat:
-                    continue
-                if auf >= zu:
-                    continue
-                t1 = text[auf : zu + 1]
-                if t1.count(symb1) != t1.count(symb2):
-                    continue
-                allresultsfinal.append([zu - auf, auf, zu, t1])
-                found = True
-                break
-            if found:
+            parents.append(stack[-1] if stack else -1)
+            depths.append(len(stack))
+            stack.append(len(starts))
+            starts.append(start)
+            ends.append(-1)
+            has_child.append(0)
+        elif stack:
+            index = stack.pop()
+            closed += 1
+            if index < 0:
+                if innermost_only:
+                    has_child[stack[max_depth]] = 1
+            elif not innermost_only:
+                ends[index] = last
+            else:
+                if parents[index] >= 0:
+                    has_child[parents[index]] = 1
+                if not has_child[index]:
+                    ends[index] = last
+            if closed == max_matches:
                 break
-        best = sorted(allresultsfinal, key=lambda x: x[0])[0]
-        goodresults.append([*best])
-        goodresultsflat.extend([best[1], best[2]])
-        aufresults.append(best[1])
-        zuresults.append(best[2])
-        newlen = len(goodresults)
-        if newlen <= oldlen:
+    if seen is not None and stack:
+        # openers that are never closed enclose the pairs above them, so
+        # depths counted at push time overstate the depths of those pairs
+        return _prune(*_nest(seen), max_depth, innermost_only)
+    if -1 in ends:
+        return _compact(starts, ends, parents)
+    return starts, ends, parents, depths
+
+
+def _prune(starts, ends, parents, depths, max_depth=None, innermost_only=False):
+    if max_depth is None and not innermost_only:
+        return starts, ends, parents, depths
+    for i, parent in enumerate(parents):
+        if max_depth is not None and depths[i] > max_depth:
+            ends[i] = -1
+        if innermost_only and parent >= 0:
+            ends[parent] = -1
+    if -1 in ends:
+        return _compact(starts, ends, parents)
+    return starts, ends, parents, depths
+
+
+_SCOPED_FLAGS = (
+    (re.IGNORECASE, "i"),
+    (re.MULTILINE, "m"),
+    (re.DOTALL, "s"),
+    (re.VERBOSE, "x"),
+    (re.ASCII, "a"),
+    (re.LOCALE, "L"),
+)
+_GLOBAL_FLAGS = re.compile(r"\(\?[aiLmsux]+\)")
+_BYTES_GLOBAL_FLAGS = re.compile(rb"\(\?[aiLmsux]+\)")
+_GROUP_NUMBER_SOURCE = r"""
+    \\(?:[0-7]{3}|0[0-7]{0,2}|(?P<ref>[1-9][0-9]?)|.)
+  | \[\^?\]?(?:\\.|[^\]\\])*\]
+  | \(\?\#[^)]*\)
+  | \(\?\((?P<cond>[0-9]+)\)
+"""
+_GROUP_NUMBER_REFS = re.compile(_GROUP_NUMBER_SOURCE, re.VERBOSE | re.DOTALL)
+_VERBOSE_GROUP_NUMBER_REFS = re.compile(
+    _GROUP_NUMBER_SOURCE + r"| \#[^\n]*", re.VERBOSE | re.DOTALL
+)
+
+
+def _refers_by_number(pattern):
+    source = pattern.pattern
+    if not isinstance(source, str):
+        source = source.decode("latin-1")
+    refs = (
+        _VERBOSE_GROUP_NUMBER_REFS
+        if pattern.flags & re.VERBOSE
+        else _GROUP_NUMBER_REFS
+    )
+    return any(m["ref"] or m["cond"] for m in refs.finditer(source))
+
+
+def _scoped_source(pattern, source):
+    as_source = str if isinstance(source, str) else str.encode
+    global_flags = _GLOBAL_FLAGS if isinstance(source, str) else _BYTES_GLOBAL_FLAGS
+    while True:
+        m = global_flags.match(source)
+        if m is None:
             break
-        oldlen = newlen
-
-    allsorted = sorted(goodresults, key=lambda x: x[:3])
-    for i in range(len(allsorted)):
-        s = set(range(allsorted[i][1], allsorted[i][2] + 1))
-        allsorted[i].extend([(tuple(sorted(list(s)))), s])
-
-    allsorted2 = deepcopy(allsorted)
-    for ini1, i in enumerate(allsorted2):
-        asstring = []
-        for ini2, j in enumerate(allsorted2):
-            if ini1 == ini2:
-                continue
-            if i[-1] < j[-1]:
-                asstring.append((j[-2]))
-        allsorted[ini1].append(asstring)
-
-    allsorted2 = deepcopy(allsorted)
-    for ini1, i in enumerate(allsorted2):
-        asstring = []
-        for ini2, j in enumerate(allsorted2):
-            if ini1 == ini2:
+        source = source[m.end() :]
+    letters = "".join(letter for flag, letter in _SCOPED_FLAGS if pattern.flags & flag)
+    end = "\n)" if pattern.flags & re.VERBOSE else ")"
+    return as_source(f"(?{letters}:") + source + as_source(end)
+
+
+def _regex_scanner(re_open, re_close, key=None):
+    # group numbers shift once both expressions share one pattern
+    if _refers_by_number(re_open) or _refers_by_number(re_close):
+        raise ValueError(
+            "regex_pairing='stack' does not support numbered backreferences, "
+            "use named groups and (?P=name) instead"
+        )
+    close_source = re_close.pattern
+    as_source = str if isinstance(close_source, str) else str.encode
+    close_names = {}
+    for name in re_close.groupindex:
+        if name in re_open.groupindex:
+            close_names[name] = f"_pf_close_{name}"
+            close_source = close_source.replace(
+                as_source(f"(?P<{name}>"), as_source(f"(?P<{close_names[name]}>")
+            ).replace(as_source(f"(?P={name})"), as_source(f"(?P={close_names[name]})"))
+    if isinstance(key, str) and not (
+        key in re_open.groupindex and key in re_close.groupindex
+    ):
+        raise ValueError(f"both expressions must define the group {key!r}")
+    pattern = re.compile(
+        as_source("(?P<_pf_open>")
+        + _scoped_source(re_open, re_open.pattern)
+        + as_source(")|(?P<_pf_close>")
+        + _scoped_source(re_close, close_source)
+        + as_source(")")
+    )
+    finditer = pattern.finditer
+
+    def scan(text):
+        for m in finditer(text):
+            start, end = m.span()
+            if start == end:
                 continue
-            if i[-2] > j[-2]:
-                asstring.append((j[-3]))
-        allsorted[ini1].append(asstring)
+            is_open = m.start("_pf_open") >= 0
+            if key is None:
+                value = None
+            elif isinstance(key, str):
+                value = m.group(key if is_open else close_names[key])
+            else:
+                value = key(m.group())
+            yield start, end - 1, is_open, value
 
-    return {
-        k[4]: {
-            "size": k[0],
-            "start": k[1],
-            "end": k[2],
-            "text": k[3],
-            "parents": sorted(k[6], key=len),
-            "children": sorted(k[7], key=len, reverse=True),
+    return scan
+
+
+def _regex_tokens(re_open, re_close, text, key=None):
+    return _regex_scanner(re_open, re_close, key)(text)
+
+
+def _nest_keyed(tokens, max_depth=None, max_matches=None, innermost_only=False):
+    stacks = {}
+    spans = []
+    for start, last, is_open, key in tokens:
+        if is_open:
+            stacks.setdefault(key, []).append(start)
+        elif stacks.get(key):
+            spans.append((stacks[key].pop(), last))
+            if len(spans) == max_matches:
+                break
+    return _prune(*_nest_spans(spans), max_depth, innermost_only)
+
+
+def _nest_spans(spans):
+    spans = sorted(spans, key=lambda span: (span[0], -span[1]))
+    starts = array("q")
+    ends = array("q")
+    parents = array("q")
+    depths = array("q")
+    stack = []
+    for start, end in spans:
+        while stack and ends[stack[-1]] < start:
+            stack.pop()
+        parent = -1
+        for candidate in reversed(stack):
+            if ends[candidate] >= end:
+                parent = candidate
+                break
+        parents.append(parent)
+        depths.append(depths[parent] + 1 if parent >= 0 else 0)
+        stack.append(len(starts))
+        starts.append(start)
+        ends.append(end)
+    return starts, ends, parents, depths
+
+
+def _regex_columns(re_open, re_close, text, key=None, **limits):
+    if isinstance(re_open, (str, bytes)):
+        re_open = re.compile(re_open)
+    if isinstance(re_close, (str, bytes)):
+        re_close = re.compile(re_close)
+    tokens = _regex_tokens(re_open, re_close, text, key)
+    return _stack_columns(text, tokens, key is not None, **limits)
+
+
+def _stack_columns(text, tokens, keyed=False, **limits):
+    if not keyed:
+        return PairColumns(
+            text, *_nest((token[:3] for token in tokens), **limits), legacy_end=True
+        )
+    return PairColumns(text, *_nest_keyed(tokens, **limits), legacy_end=True)
+
+
+def _node_key(start, end, keys):
+    if keys == "span":
+        return start, end
+    return tuple(range(start, end + 1))
+
+
+def _pairs_to_dict(text, starts, ends, parents, legacy_end, keys, lazy_text=False):
+    shift = 1 if legacy_end else 0
+    count = len(starts)
+    sizes = [ends[i] - starts[i] for i in range(count)]
+    nodekeys = [_node_key(starts[i], ends[i] + shift, keys) for i in range(count)]
+    ancestors = []
+    descendants = [[] for _ in range(count)]
+    for i in range(count):
+        parent = parents[i]
+        ancestors.append([parent, *ancestors[parent]] if parent >= 0 else [])
+        for ancestor in ancestors[i]:
+            descendants[ancestor].append(i)
+    result = {}
+    if lazy_text:
+        source = text if isinstance(text, str) else memoryview(text)
+        for i in sorted(range(count), key=lambda x: (sizes[x], starts[x])):
+            result[nodekeys[i]] = PairRecord(
+                source,
+                sizes[i] + 2 * shift,
+                starts[i],
+                ends[i] + shift,
+                ends[i] + 1,
+                [nodekeys[x] for x in ancestors[i]],
+                [
+                    nodekeys[x]
+                    for x in sorted(descendants[i], key=sizes.__getitem__, reverse=True)
+                ],
+            )
+        return result
+    if isinstance(text, (str, bytes, mmap.mmap)):
+        piece = text.__getitem__
+    else:
+        # slices of other buffers are copied, so the result does not pin them
+        view = memoryview(text)
+
+        def piece(span):
+            return bytes(view[span])
+
+    for i in sorted(range(count), key=lambda x: (sizes[x], starts[x])):
+        result[nodekeys[i]] = {
+            "size": sizes[i] + 2 * shift,
+            "start": starts[i],
+            "end": ends[i] + shift,
+            "text": piece(slice(starts[i], ends[i] + 1)),
+            "parents": [nodekeys[x] for x in ancestors[i]],
+            "children": [
+                nodekeys[x]
+                for x in sorted(descendants[i], key=sizes.__getitem__, reverse=True)
+            ],
         }
-        for k in allsorted
-    }
+    return result
 
 
-def parse_elements_multi_letters(symb1, symb2, text):
-    startletter = ""
-    endletter = ""
-    for key, item in unicode_dict.items():
-        for i in range(item["start"], item["end"]):
-            try:
-                g = str(chr(i))
-                if g not in text:
-                    if not startletter:
-                        startletter = g
-                        continue
-                    if not endletter:
-                        endletter = g
-                        break
-            except UnicodeEncodeError:
+class PairRecord(Mapping):
+    """
+    A paired element as returned with lazy_text=True. It behaves like the
+    read-only dictionary parse_pairs returns, but 'text' is only sliced
+    from the parsed input when it is looked up. For bytes-like input, the
+    text is a memoryview of the input, so no bytes are copied.
+    """
+
+    __slots__ = ("size", "start", "end", "parents", "children", "_source", "_stop")
+    _fields = ("size", "start", "end", "text", "parents", "children")
+
+    def __init__(self, source, size, start, end, stop, parents, children):
+        self._source = source
+        self.size = size
+        self.start = start
+        self.end = end
+        self._stop = stop
+        self.parents = parents
+        self.children = children
+
+    @property
+    def text(self):
+        return self._source[self.start : self._stop]
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class PairNode:
+    """
+    One matched pair inside a PairTree.
+
+    start and end are the indices of the first character of the opening
+    delimiter and the last character of the closing delimiter. parent,
+    first_child and next_sibling are node indices in the owning tree, -1 if
+    there is none.
+    """
+
+    __slots__ = ("start", "end", "depth", "parent", "first_child", "next_sibling")
+
+    def __init__(self, start, end, depth, parent, first_child=-1, next_sibling=-1):
+        self.start = start
+        self.end = end
+        self.depth = depth
+        self.parent = parent
+        self.first_child = first_child
+        self.next_sibling = next_sibling
+
+    def __repr__(self):
+        return (
+            f"PairNode(start={self.start}, end={self.end}, depth={self.depth}, "
+            f"parent={self.parent})"
+        )
+
+
+class PairTree:
+    r"""
+    Matched pairs of a single delimiter pair, stored as PairNode objects in
+    document order (by start index).
+
+    Ancestors and descendants are not stored; they are computed when asked
+    for. Use to_dict() to get the format returned by parse_pairs.
+
+    Args:
+        text (str): The parsed text.
+        starts (List[int]): Start index of every pair, in ascending order.
+        ends (List[int]): Index of the last character of every pair.
+        parents (List[int]): Index of the enclosing pair of every pair, -1 for top-level pairs.
+        legacy_end (bool): If True, to_dict() reports 'end' one past the closing
+            delimiter, like parse_pairs does for multi-letter delimiters.
+    """
+
+    def __init__(self, text, starts, ends, parents, legacy_end=False):
+        self.text = text
+        self.legacy_end = legacy_end
+        nodes = []
+        for start, end, parent in zip(starts, ends, parents):
+            depth = nodes[parent].depth + 1 if parent >= 0 else 0
+            nodes.append(PairNode(start, end, depth, parent))
+        first_root = -1
+        for i in range(len(nodes) - 1, -1, -1):
+            parent = nodes[i].parent
+            if parent >= 0:
+                nodes[i].next_sibling = nodes[parent].first_child
+                nodes[parent].first_child = i
+            else:
+                nodes[i].next_sibling = first_root
+                first_root = i
+        self.nodes = nodes
+        self.first_root = first_root
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, index):
+        return self.nodes[index]
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __repr__(self):
+        return f"<PairTree: {len(self.nodes)} pairs>"
+
+    def _siblings(self, index):
+        result = []
+        while index >= 0:
+            result.append(index)
+            index = self.nodes[index].next_sibling
+        return result
+
+    def roots(self) -> List[int]:
+        """Indices of the top-level pairs."""
+        return self._siblings(self.first_root)
+
+    def children(self, index: int) -> List[int]:
+        """Indices of the pairs directly enclosed by the pair at index."""
+        return self._siblings(self.nodes[index].first_child)
+
+    def ancestors(self, index: int) -> List[int]:
+        """Indices of all pairs enclosing the pair at index, nearest first."""
+        result = []
+        index = self.nodes[index].parent
+        while index >= 0:
+            result.append(index)
+            index = self.nodes[index].parent
+        return result
+
+    def descendants(self, index: int) -> List[int]:
+        """Indices of all pairs enclosed by the pair at index, in document order."""
+        nodes = self.nodes
+        end = nodes[index].end
+        inside = {index}
+        result = []
+        last = index + 1
+        while last < len(nodes) and nodes[last].start < end:
+            if nodes[last].parent in inside:
+                inside.add(last)
+                result.append(last)
+            last += 1
+        return result
+
+    def node_text(self, index: int) -> str:
+        """The text of the pair at index, delimiters included."""
+        node = self.nodes[index]
+        return self.text[node.start : node.end + 1]
+
+    def to_dict(
+        self, keys: str = "tuple", lazy_text: bool = False
+    ) -> Dict[Tuple[int, ...], Dict[str, Any]]:
+        """
+        Returns the pairs in the format of parse_pairs.
+
+        Args:
+            keys (str): "tuple" or "span", see parse_pairs.
+            lazy_text (bool): See parse_pairs.
+        """
+        nodes = self.nodes
+        return _pairs_to_dict(
+            self.text,
+            [node.start for node in nodes],
+            [node.end for node in nodes],
+            [node.parent for node in nodes],
+            self.legacy_end,
+            keys,
+            lazy_text,
+        )
+
+
+class PairColumns:
+    r"""
+    Matched pairs of a single delimiter pair, stored column-wise in
+    array("q") columns in document order (by start index).
+
+    Attributes:
+        text (str): The parsed text.
+        start (array): Index of the first character of every pair.
+        end (array): Index of the last character of every pair.
+        depth (array): Number of pairs enclosing every pair.
+        parent (array): Index of the enclosing pair of every pair, -1 for top-level pairs.
+        legacy_end (bool): If True, to_dict() reports 'end' one past the closing
+            delimiter, like parse_pairs does for multi-letter delimiters.
+    """
+
+    def __init__(self, text, start, end, parent, depth, legacy_end=False):
+        self.text = text
+        self.start = start
+        self.end = end
+        self.parent = parent
+        self.depth = depth
+        self.legacy_end = legacy_end
+
+    def __len__(self):
+        return len(self.start)
+
+    def __repr__(self):
+        return f"<PairColumns: {len(self.start)} pairs>"
+
+    def node_text(self, index: int) -> str:
+        """The text of the pair at index, delimiters included."""
+        return self.text[self.start[index] : self.end[index] + 1]
+
+    def to_numpy(self) -> Dict[str, Any]:
+        """
+        Returns the columns as int64 NumPy arrays sharing memory with the
+        array("q") columns. Requires NumPy.
+        """
+        import numpy as np
+
+        return {
+            name: np.frombuffer(getattr(self, name), dtype=np.int64)
+            for name in ("start", "end", "depth", "parent")
+        }
+
+    def to_tree(self) -> PairTree:
+        """Returns the pairs as a PairTree."""
+        return PairTree(
+            self.text, self.start, self.end, self.parent, legacy_end=self.legacy_end
+        )
+
+    def to_dict(
+        self, keys: str = "tuple", lazy_text: bool = False
+    ) -> Dict[Tuple[int, ...], Dict[str, Any]]:
+        """Returns the pairs in the format of parse_pairs, see PairTree.to_dict."""
+        return _pairs_to_dict(
+            self.text,
+            self.start,
+            self.end,
+            self.parent,
+            self.legacy_end,
+            keys,
+            lazy_text,
+        )
+
+
+def _crosses(starts, ends):
+    stack = []
+    for start, end in zip(starts, ends):
+        while stack and stack[-1] < start:
+            stack.pop()
+        if stack and stack[-1] < end:
+            return True
+        stack.append(end)
+    return False
+
+
+class PairIndex:
+    r"""
+    Index over the pairs of a single delimiter pair for point and range
+    queries, using binary search over the start column and jump pointers
+    to ancestors, so that a query costs O(log m + k) for m pairs and k
+    results.
+
+    The queries return indices into pairs if it is a PairColumns or a
+    PairTree, and keys of pairs if it is a dictionary returned by
+    parse_pairs. A pair covers the offsets from the first character of
+    its opening delimiter to the last character of its closing delimiter,
+    both inclusive, for every kind of pairs. Where a dictionary reports
+    'end' one past the closing delimiter, end - 1 is used, so adjacent
+    pairs such as <p>a</p><p>b</p> never share an offset. If pairs cross each other,
+    which keyed regex pairing can produce, enclosing, innermost_at and
+    overlapping scan all pairs instead.
+
+    Args:
+        pairs (Union[PairColumns, PairTree, Dict]): The parsed pairs.
+
+    Example:
+        from parifinder import PairIndex, parse_pairs
+
+        index = PairIndex(parse_pairs(text, "[", "]", keys="span"))
+        print(index.innermost_at(42), index.overlapping(100, 200))
+    """
+
+    def __init__(self, pairs: Union[PairColumns, PairTree, Dict[Any, Any]]):
+        self.keys = None
+        if isinstance(pairs, PairColumns):
+            starts, ends, parents = pairs.start, pairs.end, pairs.parent
+        elif isinstance(pairs, PairTree):
+            starts = array("q", (node.start for node in pairs))
+            ends = array("q", (node.end for node in pairs))
+            parents = array("q", (node.parent for node in pairs))
+        else:
+            spans = {}
+            for key, element in pairs.items():
+                start = element["start"]
+                end = element["end"]
+                # multi-letter and regex results report 'end' one past the
+                # closing delimiter, and 'size' as end - start + 1
+                if element["size"] > end - start:
+                    end -= 1
+                spans[start, end] = key
+            starts, ends, parents, _ = _nest_spans(spans)
+            self.keys = [spans[span] for span in zip(starts, ends)]
+        self.starts = starts
+        self.ends = ends
+        self.parents = parents
+        self.crossing = _crosses(starts, ends)
+        self._depths = None
+        # jumps[k][i] is the ancestor 2 ** k levels above pair i, or -1
+        self._jumps = []
+        if not self.crossing:
+            level = parents
+            while any(up >= 0 for up in level):
+                self._jumps.append(level)
+                level = array("q", (level[up] if up >= 0 else -1 for up in level))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __repr__(self):
+        return f"<PairIndex: {len(self.starts)} pairs>"
+
+    def _result(self, indices):
+        if self.keys is None:
+            return indices
+        keys = self.keys
+        return [keys[i] for i in indices]
+
+    def _containing(self, offset):
+        starts = self.starts
+        ends = self.ends
+        found = [i for i in range(len(starts)) if starts[i] <= offset <= ends[i]]
+        found.sort(key=lambda i: (-starts[i], ends[i]))
+        return found
+
+    def _innermost(self, offset, last_start):
+        index = bisect_right(self.starts, last_start) - 1
+        ends = self.ends
+        if index < 0 or ends[index] >= offset:
+            return index
+        # ends only grow towards the root, so jump to the outermost ancestor
+        # that still ends before offset; its parent is the answer
+        for level in reversed(self._jumps):
+            up = level[index]
+            if up >= 0 and ends[up] < offset:
+                index = up
+        return self.parents[index]
+
+    def _chain(self, index):
+        parents = self.parents
+        result = []
+        while index >= 0:
+            result.append(index)
+            index = parents[index]
+        return result
+
+    def innermost_at(self, offset: int) -> Optional[Any]:
+        """The innermost pair enclosing offset, or None."""
+        if self.crossing:
+            found = self._containing(offset)
+            return self._result(found[:1])[0] if found else None
+        index = self._innermost(offset, offset)
+        if index < 0:
+            return None
+        return self._result([index])[0]
+
+    def enclosing(self, offset: int) -> List[Any]:
+        """All pairs enclosing offset, innermost first."""
+        if self.crossing:
+            return self._result(self._containing(offset))
+        return self._result(self._chain(self._innermost(offset, offset)))
+
+    def overlapping(self, a: int, b: int) -> List[Any]:
+        """All pairs sharing at least one offset with the range [a, b), in document order."""
+        if b <= a:
+            return []
+        if self.crossing:
+            starts = self.starts
+            ends = self.ends
+            return self._result(
+                [i for i in range(len(starts)) if starts[i] < b and ends[i] >= a]
+            )
+        outer = self._chain(self._innermost(a, a - 1))
+        outer.reverse()
+        inner = range(bisect_left(self.starts, a), bisect_left(self.starts, b))
+        return self._result(outer + list(inner))
+
+    def at_depth(self, depth: int) -> List[Any]:
+        """All pairs enclosed by exactly depth other pairs, in document order."""
+        if self._depths is None:
+            levels = {}
+            depths = array("q")
+            for i, parent in enumerate(self.parents):
+                depths.append(depths[parent] + 1 if parent >= 0 else 0)
+                levels.setdefault(depths[i], []).append(i)
+            self._depths = levels
+        return self._result(list(self._depths.get(depth, ())))
+
+
+class PairEdit(NamedTuple):
+    """
+    The pairs added and removed by IncrementalPairTree.apply_edit, as
+    (start, end) spans. added uses offsets in the edited text, removed
+    offsets in the text before the edit.
+    """
+
+    added: List[Tuple[int, int]]
+    removed: List[Tuple[int, int]]
+
+
+class IncrementalPairTree:
+    r"""
+    Matched pairs of a single pair of string delimiters that are updated
+    in place when the text is edited, instead of parsing the whole text
+    again.
+
+    The pairs are stored like in PairColumns, in the attributes start, end,
+    parent and depth. An edit is rescanned only inside the innermost pair
+    that encloses it and still matches the same delimiters afterwards. The
+    pairs after the edit are shifted. For delimiters longer than one
+    character, or identical delimiters, every edit rescans the whole text.
+
+    Args:
+        text (str): The text to parse.
+        s1 (str): The opening delimiter.
+        s2 (str): The closing delimiter.
+
+    Example:
+        from parifinder import IncrementalPairTree
+
+        tree = IncrementalPairTree("(a(b)c)", "(", ")")
+        diff = tree.apply_edit(3, 4, "x)(y")
+        print(diff.added, diff.removed, tree.columns().to_dict(keys="span"))
+    """
+
+    def __init__(
+        self, text: Union[str, bytes], s1: Union[str, bytes], s2: Union[str, bytes]
+    ):
+        self.text = text
+        self.s1 = s1
+        self.s2 = s2
+        self.start, self.end, self.parent, self.depth = _nest(
+            _literal_tokens(s1, s2, text)
+        )
+
+    def __len__(self):
+        return len(self.start)
+
+    def __repr__(self):
+        return f"<IncrementalPairTree: {len(self.start)} pairs>"
+
+    def columns(self) -> PairColumns:
+        """Returns a PairColumns that shares the columns of the tree."""
+        return PairColumns(
+            self.text,
+            self.start,
+            self.end,
+            self.parent,
+            self.depth,
+            legacy_end=len(self.s1) > 1 or len(self.s2) > 1,
+        )
+
+    def _stable_parent(self, start, end, delta, text):
+        s1 = self.s1
+        s2 = self.s2
+        if len(s1) != 1 or len(s2) != 1 or s1 == s2:
+            return -1
+        starts = self.start
+        ends = self.end
+        parents = self.parent
+        index = bisect_right(starts, start - 1) - 1
+        while index >= 0:
+            if ends[index] >= end:
+                inside = text[starts[index] + 1 : ends[index] + delta]
+                if _chunk_balance(inside, s1, s2) == (0, 0):
+                    return index
+            index = parents[index]
+        return -1
+
+    def apply_edit(self, start: int, end: int, new_text: Union[str, bytes]) -> PairEdit:
+        """
+        Replaces text[start:end] with new_text and updates the pairs.
+
+        Args:
+            start (int): Start of the replaced range.
+            end (int): End of the replaced range, exclusive.
+            new_text (str): The replacement, which may be empty.
+
+        Returns:
+            PairEdit: The pairs added and removed by the edit.
+        """
+        old_text = self.text
+        if not 0 <= start <= end <= len(old_text):
+            raise ValueError(f"invalid edit range {start}:{end}")
+        text = old_text[:start] + new_text + old_text[end:]
+        delta = len(new_text) - (end - start)
+        starts = self.start
+        ends = self.end
+        parents = self.parent
+        depths = self.depth
+        outer = self._stable_parent(start, end, delta, text)
+        if outer >= 0:
+            lo = starts[outer] + 1
+            hi = ends[outer]
+            first = outer + 1
+            last = bisect_right(starts, hi, first)
+            base_depth = depths[outer] + 1
+        else:
+            lo = 0
+            hi = len(old_text)
+            first = 0
+            last = len(starts)
+            base_depth = 0
+        new_starts, new_ends, new_parents, new_depths = _nest(
+            _literal_tokens(self.s1, self.s2, text[lo : hi + delta])
+        )
+
+        kept = {}
+        for i in range(first, last):
+            old_start = starts[i]
+            old_end = ends[i]
+            if start <= old_start < end or start <= old_end < end:
                 continue
-        if endletter:
-            break
-    text2 = text.replace(symb1, startletter)
-    text2 = text2.replace(symb2, endletter)
+            kept[
+                old_start + (delta if old_start >= end else 0),
+                old_end + (delta if old_end >= end else 0),
+            ] = (old_start, old_end)
+        added = []
+        matched = set()
+        for new_start, new_end in zip(new_starts, new_ends):
+            span = new_start + lo, new_end + lo
+            if span in kept:
+                matched.add(kept[span])
+            else:
+                added.append(span)
+        removed = [
+            span
+            for span in zip(starts[first:last], ends[first:last])
+            if span not in matched
+        ]
 
-    try:
-        pe = parse_elements(startletter, endletter, text2)
-    except Exception:
-        return {}
-    lookupdict = {}
-    for key, item in pe.items():
-        origtext = symb1 + item["text"][1:-1] + symb2
-        origtextlen = len(origtext)
-
-        indi = sorted(index_all(text, origtext))
-        awv = key[0]
-        indi = [x for x in indi if x >= awv][0]
-        lookupdict[key] = tuple(range(indi, indi + origtextlen + 1))
-    pe2 = {}
-    for key, item in pe.items():
-        newindex = lookupdict[key]
-        pe2[newindex] = {
-            "size": len(newindex),
-            "start": newindex[0],
-            "end": newindex[-1],
-            "text": text[newindex[0] : newindex[-1]],
-            "parents": [lookupdict[x] for x in item["parents"]],
-            "children": [lookupdict[x] for x in item["children"]],
+        shift = len(new_starts) - (last - first)
+        for i in range(last, len(starts)):
+            starts[i] += delta
+            ends[i] += delta
+            if parents[i] >= last:
+                parents[i] += shift
+        index = outer
+        while index >= 0:
+            ends[index] += delta
+            index = parents[index]
+        starts[first:last] = array("q", (s + lo for s in new_starts))
+        ends[first:last] = array("q", (e + lo for e in new_ends))
+        parents[first:last] = array(
+            "q", (p + first if p >= 0 else outer for p in new_parents)
+        )
+        depths[first:last] = array("q", (d + base_depth for d in new_depths))
+        self.text = text
+        return PairEdit(added, removed)
+
+
+def _encode_pattern(pattern, encoding):
+    if isinstance(pattern, str):
+        return pattern.encode(encoding)
+    if isinstance(pattern, re.Pattern) and isinstance(pattern.pattern, str):
+        return re.compile(pattern.pattern.encode(encoding), pattern.flags & ~re.UNICODE)
+    return pattern
+
+
+def _format_columns(columns, result, keys, lazy_text=False):
+    if isinstance(columns, dict):
+        return {
+            pair: _format_columns(value, result, keys, lazy_text)
+            for pair, value in columns.items()
         }
-    return pe2
+    if result == "tree":
+        return columns.to_tree()
+    if result == "columns":
+        return columns
+    return columns.to_dict(keys, lazy_text)
+
+
+def parse_elements(symb1, symb2, text, keys="tuple", lazy_text=False):
+    return PairColumns(text, *_nest(_literal_tokens(symb1, symb2, text))).to_dict(
+        keys, lazy_text
+    )
 
 
-def parse_elements_regex(re_open, re_close, text):
-    if isinstance(re_open, str):
+def parse_elements_multi_letters(symb1, symb2, text, keys="tuple", lazy_text=False):
+    return PairColumns(
+        text, *_nest(_literal_tokens(symb1, symb2, text)), legacy_end=True
+    ).to_dict(keys, lazy_text)
+
+
+def parse_elements_regex(re_open, re_close, text, keys="tuple", lazy_text=False):
+    if isinstance(re_open, (str, bytes)):
         re_open = re.compile(re_open)
-    if isinstance(re_close, str):
+    if isinstance(re_close, (str, bytes)):
         re_close = re.compile(re_close)
     results = {}
     for _symb1, _symb2 in itertools.product(
@@ -2475,39 +3479,527 @@ def parse_elements_regex(re_open, re_close, text):
     ):
         try:
             results[(_symb1, _symb2)] = parse_elements_multi_letters(
-                _symb1, _symb2, text
+                _symb1, _symb2, text, keys, lazy_text
             )
         except Exception:
             continue
     return results
 
 
-def parse_multipairs(open_close_pairs, text):
-    results = {}
-    for _symb1, _symb2 in open_close_pairs:
+def parse_elements_regex_stack(
+    re_open, re_close, text, keys="tuple", key=None, lazy_text=False
+):
+    return _regex_columns(re_open, re_close, text, key).to_dict(keys, lazy_text)
+
+
+def parse_multipairs(open_close_pairs, text, keys="tuple", lazy_text=False):
+    return {
+        pair: columns.to_dict(keys, lazy_text)
+        for pair, columns in _multipair_columns(open_close_pairs, text).items()
+    }
+
+
+def _chunk_profile(chunk, symb1, symb2):
+    # firsts[k - 1] is the offset just after the closer where the running
+    # balance first drops to -k, i.e. where an entry depth of k reaches 0
+    depth = low = 0
+    firsts = []
+    for _, last, is_open in _literal_tokens(symb1, symb2, chunk):
+        if is_open:
+            depth += 1
+        else:
+            depth -= 1
+            if depth < low:
+                low = depth
+                firsts.append(last + 1)
+    return -low, depth - low, firsts
+
+
+def _chunk_balance(chunk, symb1, symb2):
+    closers, openers, _ = _chunk_profile(chunk, symb1, symb2)
+    return closers, openers
+
+
+def _segment_nest(segment, symb1, symb2, limits):
+    return _nest(_literal_tokens(symb1, symb2, segment), **limits)
+
+
+_MIN_SPLIT = 1 << 16
+
+
+def _slices(text, bounds):
+    # memoryviews cannot be pickled, so their slices are sent as bytes
+    if isinstance(text, memoryview):
+        return [bytes(text[a:b]) for a, b in zip(bounds, bounds[1:])]
+    return [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+def _split_nest(text, symb1, symb2, workers, **limits):
+    parts = min(workers, len(text) // _MIN_SPLIT)
+    if parts < 2:
+        return _nest(_literal_tokens(symb1, symb2, text), **limits)
+    bounds = [len(text) * i // parts for i in range(parts + 1)]
+    with ProcessPoolExecutor(workers) as executor:
+        profiles = executor.map(
+            _chunk_profile,
+            _slices(text, bounds),
+            itertools.repeat(symb1),
+            itertools.repeat(symb2),
+        )
+        cuts = [0]
+        depth = 0
+        for i, (closers, openers, firsts) in enumerate(profiles):
+            if i and depth <= closers:
+                cut = bounds[i] + firsts[depth - 1] if depth else bounds[i]
+                if cuts[-1] < cut < len(text):
+                    cuts.append(cut)
+            depth = max(depth - closers, 0) + openers
+        if len(cuts) == 1:
+            return _nest(_literal_tokens(symb1, symb2, text), **limits)
+        cuts.append(len(text))
+        segments = executor.map(
+            _segment_nest,
+            _slices(text, cuts),
+            itertools.repeat(symb1),
+            itertools.repeat(symb2),
+            itertools.repeat(limits),
+        )
+        starts = array("q")
+        ends = array("q")
+        parents = array("q")
+        depths = array("q")
+        for offset, (seg_starts, seg_ends, seg_parents, seg_depths) in zip(
+            cuts, segments
+        ):
+            base = len(starts)
+            starts.extend(start + offset for start in seg_starts)
+            ends.extend(end + offset for end in seg_ends)
+            parents.extend(
+                parent + base if parent >= 0 else -1 for parent in seg_parents
+            )
+            depths.extend(seg_depths)
+    return starts, ends, parents, depths
+
+
+class PairParser:
+    r"""
+    Parses paired elements with fixed delimiters. Everything that only
+    depends on the delimiters (escaping and compiling the patterns, encoding
+    them for bytes input, building the multipair automaton and choosing the
+    parsing mode) is done once, so parse() and iter() only scan the text.
+    Use compile() to get a cached parser.
+
+    Args:
+        s1, s2, str_regex, regex_pairing, regex_key, encoding: See parse_pairs.
+
+    Example:
+        from parifinder import PairParser
+
+        parser = PairParser("<p>", "</p>")
+        results = [parser.parse(page, keys="span") for page in pages]
+    """
+
+    def __init__(
+        self,
+        s1: Union[str, bytes, List[str], List[Tuple[str, str]], re.Pattern],
+        s2: Optional[
+            Union[str, bytes, List[str], List[Tuple[str, str]], re.Pattern]
+        ] = None,
+        str_regex: bool = False,
+        regex_pairing: str = "product",
+        regex_key: Optional[Union[str, Callable[[str], Any]]] = None,
+        encoding: str = "utf-8",
+    ):
+        if (
+            isinstance(s1, (str, bytes))
+            and isinstance(s2, (str, bytes))
+            and not str_regex
+        ):
+            self.mode = "literal"
+        elif isinstance(s1, (list, tuple)) and (
+            isinstance(s2, (list, tuple)) or isinstance(s2, type(None))
+        ):
+            self.mode = "multipair"
+            s1 = list(s1) if isinstance(s2, type(None)) else list(zip(s1, s2))
+        elif regex_pairing in ("product", "stack"):
+            self.mode = regex_pairing
+        else:
+            raise ValueError(
+                f"regex_pairing must be 'product' or 'stack', not {regex_pairing!r}"
+            )
+        self.s1 = s1
+        self.s2 = s2
+        self.regex_key = regex_key
+        self.encoding = encoding
+        self._scanners = {}
+
+    def _scanner(self, binary, mode=None):
+        mode = mode or self.mode
         try:
-            results[(_symb1, _symb2)] = parse_elements_multi_letters(
-                _symb1, _symb2, text
+            return self._scanners[binary, mode]
+        except KeyError:
+            pass
+        s1 = self.s1
+        s2 = self.s2
+        if mode == "multipair":
+            scanner = _multipair_scanner(s1, binary, self.encoding)
+        else:
+            if binary:
+                s1 = _encode_pattern(s1, self.encoding)
+                s2 = _encode_pattern(s2, self.encoding)
+            if mode == "literal":
+                scanner = _literal_scanner(s1, s2)
+            else:
+                if isinstance(s1, (str, bytes)):
+                    s1 = re.compile(s1)
+                if isinstance(s2, (str, bytes)):
+                    s2 = re.compile(s2)
+                scanner = None
+                if mode == "stack":
+                    scanner = _regex_scanner(s1, s2, self.regex_key)
+        self._scanners[binary, mode] = scanner, s1, s2
+        return scanner, s1, s2
+
+    def parse(
+        self,
+        string: Union[str, bytes, bytearray, memoryview, mmap.mmap, os.PathLike],
+        keys: str = "tuple",
+        result: str = "dict",
+        lazy_text: bool = False,
+        max_matches: Optional[int] = None,
+        max_depth: Optional[int] = None,
+        outermost_only: bool = False,
+        innermost_only: bool = False,
+        workers: Optional[int] = None,
+    ) -> Any:
+        """
+        Parses string like parse_pairs does with the delimiters of the parser.
+        See parse_pairs for the arguments and the result.
+        """
+        if keys not in ("tuple", "span"):
+            raise ValueError(f"keys must be 'tuple' or 'span', not {keys!r}")
+        if result not in ("dict", "tree", "columns"):
+            raise ValueError(
+                f"result must be 'dict', 'tree' or 'columns', not {result!r}"
             )
-        except Exception:
+        limits = {
+            "max_depth": 0 if outermost_only else max_depth,
+            "max_matches": max_matches,
+            "innermost_only": innermost_only,
+        }
+        if isinstance(string, os.PathLike):
+            string = map_file(string)
+        scanner, s1, s2 = self._scanner(not isinstance(string, str))
+        mode = self.mode
+        if mode == "literal":
+            if (
+                workers is not None
+                and workers > 1
+                and max_matches is None
+                and len(s1) == 1
+                and len(s2) == 1
+                and s1 != s2
+            ):
+                nested = _split_nest(string, s1, s2, workers, **limits)
+            else:
+                nested = _nest(scanner(string), **limits)
+            columns = PairColumns(
+                string, *nested, legacy_end=len(s1) > 1 or len(s2) > 1
+            )
+        elif mode == "multipair":
+            columns = scanner(string, **limits)
+        elif mode == "stack":
+            columns = _stack_columns(
+                string, scanner(string), self.regex_key is not None, **limits
+            )
+        elif result != "dict":
+            raise ValueError(f"result={result!r} requires regex_pairing='stack'")
+        elif (
+            max_matches is not None or limits["max_depth"] is not None or innermost_only
+        ):
+            raise ValueError("match limits require regex_pairing='stack'")
+        else:
+            return parse_elements_regex(s1, s2, string, keys, lazy_text)
+        return _format_columns(columns, result, keys, lazy_text)
+
+    def iter(
+        self,
+        string: Union[str, bytes, bytearray, memoryview, mmap.mmap, os.PathLike],
+        order: str = "close",
+    ) -> Iterator["PairMatch"]:
+        """
+        Lazily yields the paired elements of string like iter_pairs does with
+        the delimiters of the parser. Regular expressions are always paired
+        like with regex_pairing="stack".
+        """
+        if order not in ("close", "open"):
+            raise ValueError(f"order must be 'close' or 'open', not {order!r}")
+        if self.mode == "multipair":
+            raise ValueError("iter requires a single pair of delimiters")
+        if isinstance(string, os.PathLike):
+            string = map_file(string)
+        mode = "literal" if self.mode == "literal" else "stack"
+        scanner = self._scanner(not isinstance(string, str), mode)[0]
+        return _iter_matches(scanner(string), order)
+
+    def stream(self, fileobj: IO, chunk_size: int = 1 << 20) -> Iterator["PairMatch"]:
+        """
+        Parses paired elements from a file object chunk by chunk like
+        parse_pairs_stream does with the delimiters of the parser, which must
+        be string delimiters. The delimiters are encoded if fileobj is opened
+        in binary mode.
+        """
+        if self.mode != "literal":
+            raise ValueError("stream requires string delimiters")
+        chunks = _read_chunks(fileobj, chunk_size)
+        return _iter_matches(_stream_tokens(chunks, self.s1, self.s2, self.encoding))
+
+
+_parsers = OrderedDict()
+_parsers_lock = threading.Lock()
+_MAXPARSERS = 256
+
+
+def _spec_key(s1, s2, str_regex, regex_pairing, regex_key, encoding):
+    return (
+        type(s1),
+        tuple(s1) if isinstance(s1, list) else s1,
+        type(s2),
+        tuple(s2) if isinstance(s2, list) else s2,
+        str_regex,
+        regex_pairing,
+        regex_key,
+        encoding,
+    )
+
+
+def compile(
+    s1: Union[str, bytes, List[str], List[Tuple[str, str]], re.Pattern],
+    s2: Optional[
+        Union[str, bytes, List[str], List[Tuple[str, str]], re.Pattern]
+    ] = None,
+    str_regex: bool = False,
+    regex_pairing: str = "product",
+    regex_key: Optional[Union[str, Callable[[str], Any]]] = None,
+    encoding: str = "utf-8",
+) -> PairParser:
+    r"""
+    Returns a PairParser for the given delimiters, like re.compile does for
+    regular expressions. The most recently used parsers are cached, so
+    compiling the same delimiters again returns the same parser.
+    parse_pairs, iter_pairs and parse_pairs_stream use this cache too.
+
+    Args:
+        s1, s2, str_regex, regex_pairing, regex_key, encoding: See parse_pairs.
+
+    Returns:
+        PairParser: The parser, with parse(), iter() and stream() methods.
+
+    Example:
+        import parifinder
+
+        brackets = parifinder.compile("[", "]")
+        for line in lines:
+            for pair in brackets.iter(line):
+                print(pair.start, pair.end, pair.open_depth)
+    """
+    key = _spec_key(s1, s2, str_regex, regex_pairing, regex_key, encoding)
+    try:
+        with _parsers_lock:
+            parser = _parsers.get(key)
+            if parser is not None:
+                _parsers.move_to_end(key)
+                return parser
+    except TypeError:
+        return PairParser(s1, s2, str_regex, regex_pairing, regex_key, encoding)
+    parser = PairParser(s1, s2, str_regex, regex_pairing, regex_key, encoding)
+    with _parsers_lock:
+        parser = _parsers.setdefault(key, parser)
+        while len(_parsers) > _MAXPARSERS:
+            _parsers.popitem(last=False)
+    return parser
+
+
+class CacheInfo(NamedTuple):
+    """Statistics of the parse_pairs result cache, as returned by cache_info."""
+
+    hits: int
+    misses: int
+    maxsize: Optional[int]
+    currsize: int
+    maxbytes: Optional[int]
+    currbytes: int
+    enabled: bool
+
+
+class _ResultCache:
+    def __init__(self):
+        self.enabled = False
+        self.maxsize = 128
+        self.maxbytes = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.currbytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                return
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            self.entries[key] = value, size
+            self.currbytes += size
+            self.trim()
+
+    def trim(self):
+        entries = self.entries
+        while entries and (
+            (self.maxsize is not None and len(entries) > self.maxsize)
+            or (self.maxbytes is not None and self.currbytes > self.maxbytes)
+        ):
+            self.currbytes -= entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.currbytes = 0
+
+
+_results = _ResultCache()
+
+
+def _content_key(string):
+    data = (
+        string.encode("utf-8", "surrogatepass") if isinstance(string, str) else string
+    )
+    return (
+        type(string),
+        len(string),
+        hashlib.blake2b(data, digest_size=16).digest(),
+    )
+
+
+def _result_size(value):
+    # a rough estimate of the memory held by a parse_pairs result: keys of
+    # character indices cost a pointer and an int object per index
+    if isinstance(value, PairColumns):
+        return len(value) * 32
+    if isinstance(value, PairTree):
+        return len(value) * 120
+    size = 0
+    for key, element in value.items():
+        if not isinstance(element, Mapping) or "size" not in element:
+            size += _result_size(element)
             continue
-    return results
+        size += 400 + 36 * len(key)
+        size += 8 * (len(element["parents"]) + len(element["children"]))
+        if not isinstance(element, PairRecord):
+            size += len(element["text"])
+    return size
+
+
+_UNCHANGED = object()
+
+
+def cache_configure(
+    maxsize: Optional[int] = _UNCHANGED,
+    maxbytes: Optional[int] = _UNCHANGED,
+    enabled: bool = _UNCHANGED,
+) -> None:
+    """
+    Enables, resizes or disables the result cache of parse_pairs, which is
+    disabled by default. Only the settings that are passed are changed, so
+    cache_configure(enabled=True) is needed to turn the cache on. Until
+    they are set, maxsize is 128 and maxbytes is None.
+
+    Results are cached by the type and a BLAKE2b hash of the input, the
+    delimiters and the options, and the least recently used results are
+    evicted first. Results that keep a reference to a mutable or
+    memory-mapped input (result="tree" or "columns", lazy_text=True, or a
+    memoryview input) are not cached.
+    A cached result is returned as is on later calls, so it must not be
+    modified.
+
+    Args:
+        maxsize (Optional[int]): Maximum number of cached results, None for no limit.
+        maxbytes (Optional[int]): Maximum estimated memory of the cached results in bytes, None for no limit. Each result is charged the length of its input plus an estimate of its texts, keys and parent and child lists, which can grow quadratically with the nesting depth for keys="tuple".
+        enabled (bool): If False, the cache is disabled and emptied.
+    """
+    with _results.lock:
+        if enabled is not _UNCHANGED:
+            _results.enabled = enabled
+        if maxsize is not _UNCHANGED:
+            _results.maxsize = maxsize
+        if maxbytes is not _UNCHANGED:
+            _results.maxbytes = maxbytes
+        if not _results.enabled:
+            _results.entries.clear()
+            _results.currbytes = 0
+        _results.trim()
+
+
+def cache_info() -> CacheInfo:
+    """Returns the statistics of the parse_pairs result cache."""
+    with _results.lock:
+        return CacheInfo(
+            _results.hits,
+            _results.misses,
+            _results.maxsize,
+            len(_results.entries),
+            _results.maxbytes,
+            _results.currbytes,
+            _results.enabled,
+        )
+
+
+def cache_clear() -> None:
+    """Empties the parse_pairs result cache and resets its statistics."""
+    _results.clear()
 
 
 def parse_pairs(
-    string: str,
-    s1: Union[str, List[str], List[Tuple[str, str]], re.Pattern[str]],
-    s2: Optional[Union[str, List[str], List[Tuple[str, str]], re.Pattern[str]]] = None,
+    string: Union[str, bytes, bytearray, memoryview, mmap.mmap, os.PathLike],
+    s1: Union[str, bytes, List[str], List[Tuple[str, str]], re.Pattern],
+    s2: Optional[
+        Union[str, bytes, List[str], List[Tuple[str, str]], re.Pattern]
+    ] = None,
     str_regex: bool = False,
+    keys: str = "tuple",
+    result: str = "dict",
+    regex_pairing: str = "product",
+    regex_key: Optional[Union[str, Callable[[str], Any]]] = None,
+    encoding: str = "utf-8",
+    lazy_text: bool = False,
+    max_matches: Optional[int] = None,
+    max_depth: Optional[int] = None,
+    outermost_only: bool = False,
+    innermost_only: bool = False,
+    workers: Optional[int] = None,
 ) -> Dict[
     Union[str, Tuple[str, str]],
     Union[Dict[str, Any], Dict[Tuple[int, int], Dict[str, Any]]],
 ]:
     r"""
     Parses paired elements within a given string using specified delimiters.
+    Results can be cached across calls, see cache_configure.
 
     Args:
         string (str): The input text to be parsed.
+            - It can also be bytes, a bytearray, a memoryview, an mmap.mmap or a path (os.PathLike) to a file that is memory-mapped with map_file. The bytes are scanned in place, indices are byte offsets and texts are bytes.
         s1 (Union[str, List[Tuple[str, str]], re.Pattern[str]): The opening delimiter(s) to identify paired elements.
             - If a single string, it represents the opening delimiter for a single pair.
             - If a list of tuples, each tuple contains the opening and closing delimiters for multiple pairs.
@@ -2518,6 +4010,27 @@ def parse_pairs(
             - If None, each tuple in s1 contains the closing delimiter(s) for multiple pairs.
             - If a regular expression pattern (compiled using re.compile), it defines the closing delimiter(s) using regex.
         str_regex (bool): If True, treat s1 and s2 as regular expressions; if False, treat them as string delimiters.
+        keys (str): How elements are keyed and referenced in the result.
+            - "tuple" (default): by the tuple of every character index the element covers.
+            - "span": by the (start, end) tuple of the element, which keeps memory proportional to the number of elements instead of their length.
+        result (str): The type of the returned result.
+            - "dict" (default): the dictionary described below.
+            - "tree": a PairTree, which computes parents and children only when asked for.
+            - "columns": a PairColumns, which stores start, end, depth and parent in array("q") columns.
+            "tree" and "columns" are not available with regex_pairing="product". For several pairs of delimiters, the values of the returned dictionary are of the chosen type.
+        regex_pairing (str): How regular expression delimiters are paired.
+            - "product" (default): every distinct opening match is paired with every distinct closing match, and each combination is parsed separately.
+            - "stack": the text is scanned once for both expressions and every closing match is paired with the most recent open opening match. The result describes the paired elements directly, like for string delimiters. Numbered backreferences and conditionals inside the expressions raise a ValueError; use named groups and (?P=name) instead.
+        regex_key (Optional[Union[str, Callable[[str], Any]]]): Only used with regex_pairing="stack". A closing match only pairs with an opening match that has the same key.
+            - If a callable, it is called with the text of every opening and closing match to get its key.
+            - If a string, it is the name of a group defined in both expressions, and the text matched by that group is the key, e.g. s1=r"\[(?P<id>\d)" and s2=r"/(?P<id>\d)]" with regex_key="id".
+        encoding (str): Encoding used for str delimiters and regular expressions if string is not a str. Delimiters and regular expressions can also be given as bytes.
+        lazy_text (bool): If True, the elements are PairRecord mappings that hold only offsets, and 'text' is sliced from string when it is looked up (as a zero-copy memoryview for bytes-like input).
+        max_matches (Optional[int]): Stop parsing after this many pairs have been closed. Pairs that are still open at that point are not returned, and max_depth, outermost_only and innermost_only only select among the closed pairs.
+        max_depth (Optional[int]): Skip pairs enclosed by more than this many matched pairs, i.e. whose depth in the full result is greater; 0 keeps only the pairs without parents.
+        outermost_only (bool): Same as max_depth=0.
+        innermost_only (bool): Only return pairs that do not enclose another pair. With any of these four options, parents and children only refer to returned pairs; they are not available with regex_pairing="product".
+        workers (Optional[int]): If greater than 1, a long text with single-character delimiters (s1 != s2) is split at points outside of every pair and the parts are parsed in this many processes. The result is the same as without workers. Other delimiters, max_matches and short texts are parsed in this process.
 
     Returns:
         Dict[Union[str, Tuple[str, str]], Union[Dict[str, Any], Dict[Tuple[int, int], Dict[str, Any]]]: A dictionary where the keys are either a single pair (if s1 and s2 are strings) or a tuple of regular expression patterns (if s1 and s2 are regex patterns). The values are dictionaries describing the paired elements found in the input string.
@@ -2527,8 +4040,8 @@ def parse_pairs(
     - 'start': int - Starting index of the element in the input string.
     - 'end': int - Ending index of the element in the input string.
     - 'text': str - The text content of the parsed element.
-    - 'parents': List[List[int]] - List of indices for elements that enclose the current element.
-    - 'children': List[List[int]] - List of indices for elements enclosed by the current element.
+    - 'parents': List[Tuple[int, ...]] - Keys of the elements that enclose the current element.
+    - 'children': List[Tuple[int, ...]] - Keys of the elements enclosed by the current element.
 
     Examples:
         from parifinder import parse_pairs
@@ -2569,21 +4082,435 @@ def parse_pairs(
         print("r4-----------------------------------------------------------------")
         pprint(r4, indent=1, width=1)
 
+        text_5 = "[1bla[2bla/2]/1]"
+        s1_5 = r"\[(?P<id>\d)"
+        s2_5 = r"/(?P<id>\d)]"
+        r5 = parse_pairs(string=text_5, s1=s1_5, s2=s2_5, str_regex=True, regex_pairing="stack", regex_key="id")
+        print("r5-----------------------------------------------------------------")
+        pprint(r5, indent=1, width=1)
+
     """
-    if isinstance(s1, str) and isinstance(s2, str):
-        if not str_regex:
-            if len(s1) > 1 or len(s2) > 1:
-                return parse_elements_multi_letters(s1, s2, string)
-            else:
-                return parse_elements(s1, s2, string)
-        else:
-            return parse_elements_regex(s1, s2, string)
-    elif isinstance(s1, (list, tuple)) and (
-        isinstance(s2, (list, tuple)) or isinstance(s2, type(None))
+    parser = compile(s1, s2, str_regex, regex_pairing, regex_key, encoding)
+    options = (
+        keys,
+        result,
+        lazy_text,
+        max_matches,
+        max_depth,
+        outermost_only,
+        innermost_only,
+    )
+    if not _results.enabled:
+        return parser.parse(string, *options, workers)
+    if isinstance(string, os.PathLike):
+        string = map_file(string)
+    if not isinstance(string, (str, bytes)) and (
+        result != "dict" or lazy_text or isinstance(string, memoryview)
     ):
-        if isinstance(s2, type(None)):
-            return parse_multipairs(s1, string)
-        else:
-            return parse_multipairs([list(x) for x in zip(*[s1, s2])], string)
-    else:
-        return parse_elements_regex(s1, s2, string)
+        return parser.parse(string, *options, workers)
+    key = (
+        _content_key(string),
+        _spec_key(s1, s2, str_regex, regex_pairing, regex_key, encoding),
+        options,
+    )
+    try:
+        entry = _results.get(key)
+    except TypeError:
+        return parser.parse(string, *options, workers)
+    if entry is not None:
+        return entry[0]
+    value = parser.parse(string, *options, workers)
+    _results.put(key, value, len(string) + _result_size(value))
+    return value
+
+
+def parse_pairs_many(
+    strings: Iterable[Union[str, bytes, bytearray, memoryview, mmap.mmap]],
+    s1: Union[str, bytes, List[str], List[Tuple[str, str]], re.Pattern],
+    s2: Optional[
+        Union[str, bytes, List[str], List[Tuple[str, str]], re.Pattern]
+    ] = None,
+    str_regex: bool = False,
+    regex_pairing: str = "product",
+    regex_key: Optional[Union[str, Callable[[str], Any]]] = None,
+    encoding: str = "utf-8",
+    **options: Any,
+) -> List[Any]:
+    r"""
+    Parses many strings with the same delimiters. The delimiters are set up
+    once by a PairParser, and each string is then parsed with parse().
+
+    Args:
+        strings (Iterable): The input texts.
+        s1, s2, str_regex, regex_pairing, regex_key, encoding: See parse_pairs.
+        **options: Keyword arguments of PairParser.parse, e.g. keys="span" or result="columns".
+
+    Returns:
+        List[Any]: The result of parse_pairs for every string, in the same order.
+
+    Example:
+        from parifinder import parse_pairs_many
+
+        results = parse_pairs_many(lines, "[", "]", keys="span")
+    """
+    parse = PairParser(s1, s2, str_regex, regex_pairing, regex_key, encoding).parse
+    return [parse(string, **options) for string in strings]
+
+
+class PairMatch(NamedTuple):
+    """
+    A matched pair, as yielded by iter_pairs and parse_pairs_stream.
+
+    start is the index of the first character of the opening delimiter, end
+    the index of the last character of the closing delimiter, and open_depth
+    the number of opening delimiters that were still open when the pair was
+    opened. Pairs are yielded before the rest of the text is read, so
+    open_depth also counts opening delimiters that are never closed. It is
+    therefore not always equal to the depth column of PairColumns, which
+    only counts matched enclosing pairs: in "((a)(b)", both pairs have
+    open_depth 1 but depth 0.
+    """
+
+    start: int
+    end: int
+    open_depth: int
+
+
+def _iter_matches(tokens, order="close"):
+    stacks = {}
+    depth = 0
+    pending = deque()
+    for token in tokens:
+        start, last, is_open = token[:3]
+        stack = stacks.setdefault(token[3] if len(token) > 3 else None, [])
+        if is_open or (is_open is None and not stack):
+            entry = [start, -1, depth]
+            stack.append(entry)
+            depth += 1
+            if order == "open":
+                pending.append(entry)
+        elif stack:
+            entry = stack.pop()
+            entry[1] = last
+            depth -= 1
+            if order == "open":
+                while pending and pending[0][1] >= 0:
+                    yield PairMatch(*pending.popleft())
+            else:
+                yield PairMatch(*entry)
+    for entry in pending:
+        if entry[1] >= 0:
+            yield PairMatch(*entry)
+
+
+def iter_pairs(
+    string: Union[str, bytes, bytearray, memoryview, mmap.mmap, os.PathLike],
+    s1: Union[str, bytes, re.Pattern],
+    s2: Union[str, bytes, re.Pattern],
+    str_regex: bool = False,
+    regex_key: Optional[Union[str, Callable[[str], Any]]] = None,
+    order: str = "close",
+    encoding: str = "utf-8",
+) -> Iterator[PairMatch]:
+    r"""
+    Lazily yields the paired elements of a single pair of delimiters,
+    without building a result dictionary.
+
+    The text is tokenized while the pairs are consumed, so stopping early
+    skips the rest of the work.
+
+    Args:
+        string: The input text, see parse_pairs.
+        s1 (Union[str, bytes, re.Pattern]): The opening delimiter.
+        s2 (Union[str, bytes, re.Pattern]): The closing delimiter.
+        str_regex (bool): If True, or if s1 and s2 are compiled patterns, they are
+            regular expressions paired like with regex_pairing="stack" in parse_pairs.
+        regex_key (Optional[Union[str, Callable[[str], Any]]]): See parse_pairs.
+        order (str): "close" (default) yields each pair as soon as it is closed,
+            "open" yields the pairs in the order of their opening delimiters.
+        encoding (str): See parse_pairs.
+
+    Returns:
+        Iterator[PairMatch]: The matched pairs.
+
+    Example:
+        from parifinder import iter_pairs
+
+        first_ten = [pair for pair, _ in zip(iter_pairs(text, "[", "]"), range(10))]
+    """
+    return compile(s1, s2, str_regex, regex_key=regex_key, encoding=encoding).iter(
+        string, order
+    )
+
+
+def _read_chunks(fileobj, chunk_size):
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_pairs_stream(
+    fileobj: IO, s1: str, s2: str, chunk_size: int = 1 << 20
+) -> Iterator[PairMatch]:
+    r"""
+    Parses paired elements from a file object chunk by chunk, without
+    reading the whole file into memory.
+
+    Each pair is yielded as soon as its closing delimiter has been read,
+    so pairs come in the order of their closing delimiters. The open
+    delimiters and a delimiter cut in half by a chunk boundary are carried
+    over to the next chunk. Offsets are absolute positions in the stream.
+
+    Args:
+        fileobj (IO): A file object opened in text or binary mode. In binary mode, str delimiters are encoded as UTF-8 and offsets are byte offsets.
+        s1 (str): The opening delimiter.
+        s2 (str): The closing delimiter.
+        chunk_size (int): Number of characters read at once.
+
+    Returns:
+        Iterator[PairMatch]: The matched pairs.
+
+    Example:
+        from parifinder import parse_pairs_stream
+
+        with open("big.log", encoding="utf-8") as f:
+            for pair in parse_pairs_stream(f, "[", "]"):
+                print(pair.start, pair.end, pair.open_depth)
+    """
+    return compile(s1, s2).stream(fileobj, chunk_size)
+
+
+_worker_parser = None
+_worker_options = None
+
+
+def _init_worker(spec, options):
+    global _worker_parser, _worker_options
+    _worker_parser = compile(*spec)
+    _worker_options = options
+
+
+def _columns_state(columns):
+    if isinstance(columns, dict):
+        return {pair: _columns_state(value) for pair, value in columns.items()}
+    return columns.start, columns.end, columns.parent, columns.depth, columns.legacy_end
+
+
+def _columns_from_state(text, state):
+    if isinstance(state, dict):
+        return {pair: _columns_from_state(text, value) for pair, value in state.items()}
+    return PairColumns(text, *state)
+
+
+def _parse_batch(batch):
+    parser = _worker_parser
+    options = _worker_options
+    if parser.mode == "product":
+        return [parser.parse(doc, **options) for doc in batch]
+    options = dict(options, keys="tuple", result="columns", lazy_text=False)
+    return [_columns_state(parser.parse(doc, **options)) for doc in batch]
+
+
+def _parallel_results(docs, spec, options, workers, chunksize, ordered):
+    product = compile(*spec).mode == "product"
+    keys = options.get("keys", "tuple")
+    result = options.get("result", "dict")
+    lazy_text = options.get("lazy_text", False)
+    docs = iter(docs)
+    with ProcessPoolExecutor(
+        workers, initializer=_init_worker, initargs=(spec, options)
+    ) as executor:
+        pending = deque()
+        first = 0
+        while True:
+            while len(pending) < 2 * workers:
+                batch = list(itertools.islice(docs, chunksize))
+                if not batch:
+                    break
+                pending.append((first, batch, executor.submit(_parse_batch, batch)))
+                first += len(batch)
+            if not pending:
+                return
+            if ordered:
+                index, batch, future = pending.popleft()
+            else:
+                wait([entry[2] for entry in pending], return_when=FIRST_COMPLETED)
+                entry = next(entry for entry in pending if entry[2].done())
+                pending.remove(entry)
+                index, batch, future = entry
+            for index, (doc, state) in enumerate(zip(batch, future.result()), index):
+                if not product:
+                    text = map_file(doc) if isinstance(doc, os.PathLike) else doc
+                    state = _format_columns(
+                        _columns_from_state(text, state), result, keys, lazy_text
+                    )
+                yield state if ordered else (index, state)
+
+
+def parse_pairs_parallel(
+    docs: Iterable[Union[str, bytes, os.PathLike]],
+    s1: Union[str, bytes, List[str], List[Tuple[str, str]], re.Pattern],
+    s2: Optional[
+        Union[str, bytes, List[str], List[Tuple[str, str]], re.Pattern]
+    ] = None,
+    str_regex: bool = False,
+    regex_pairing: str = "product",
+    regex_key: Optional[Union[str, Callable[[str], Any]]] = None,
+    encoding: str = "utf-8",
+    workers: Optional[int] = None,
+    chunksize: int = 64,
+    ordered: bool = True,
+    **options: Any,
+) -> Iterator[Any]:
+    r"""
+    Parses many documents in a pool of worker processes.
+
+    The delimiters and options are sent once to every worker, which compiles
+    its own parser. Documents are sent in batches of chunksize, and workers
+    send back only the start, end, parent and depth columns of each
+    document, from which the results are built in this process.
+
+    Args:
+        docs (Iterable[Union[str, bytes, os.PathLike]]): The input texts, or paths of files that are memory-mapped by the workers and by this process.
+        s1, s2, str_regex, regex_pairing, regex_key, encoding: See parse_pairs. They are pickled for the workers, so regex_key cannot be a lambda.
+        workers (Optional[int]): Number of worker processes, os.cpu_count() by default.
+        chunksize (int): Number of documents sent to a worker at once.
+        ordered (bool): If True, the results are yielded in the order of docs. If False, (index, result) tuples are yielded as soon as their batch is done.
+        **options: Keyword arguments of PairParser.parse, e.g. keys="span" or result="columns".
+
+    Returns:
+        Iterator[Any]: The result of parse_pairs for every document.
+
+    Example:
+        from parifinder import parse_pairs_parallel
+
+        if __name__ == "__main__":
+            for result in parse_pairs_parallel(docs, "[", "]", workers=8, keys="span"):
+                print(len(result))
+    """
+    compile(s1, s2, str_regex, regex_pairing, regex_key, encoding)
+    spec = (s1, s2, str_regex, regex_pairing, regex_key, encoding)
+    workers = workers or os.cpu_count() or 1
+    return _parallel_results(docs, spec, options, workers, chunksize, ordered)
+
+
+_COLUMNS_MAGIC = b"PFCOLS\x01\x00"
+
+
+def save_columns(columns: PairColumns, path: Union[str, os.PathLike]) -> None:
+    """
+    Writes the columns of a PairColumns to a binary file that load_columns
+    memory-maps back. The file holds a 32-byte header (magic, byte order
+    mark, number of pairs, legacy_end) followed by the start, end, parent
+    and depth columns as native int64 values. The text is not stored.
+
+    The file is written next to path and renamed over it, so readers never
+    see a partial file.
+    """
+    header = array("q", (1, len(columns), int(columns.legacy_end)))
+    temp = f"{os.fspath(path)}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+        f.write(_COLUMNS_MAGIC)
+        f.write(header)
+        for name in ("start", "end", "parent", "depth"):
+            f.write(getattr(columns, name))
+    os.replace(temp, path)
+
+
+def load_columns(
+    path: Union[str, os.PathLike], text: Union[str, bytes, mmap.mmap, None] = None
+) -> PairColumns:
+    """
+    Memory-maps a file written by save_columns. The columns are memoryviews
+    of the mapping cast to int64, so nothing is parsed or copied, and
+    processes loading the same file share its pages.
+
+    Args:
+        path: The file written by save_columns.
+        text: The parsed text, used for node_text and to_dict.
+    """
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(data)
+    if view[:8] != _COLUMNS_MAGIC:
+        raise ValueError(f"{os.fspath(path)!r} is not a columns file")
+    order, count, legacy_end = view[8:32].cast("q")
+    if order != 1:
+        raise ValueError(f"{os.fspath(path)!r} was written with another byte order")
+    if len(view) != 32 + 32 * count:
+        raise ValueError(f"{os.fspath(path)!r} is truncated")
+    start, end, parent, depth = (
+        view[32 + 8 * count * i : 32 + 8 * count * (i + 1)].cast("q") for i in range(4)
+    )
+    return PairColumns(text, start, end, parent, depth, legacy_end=bool(legacy_end))
+
+
+def parse_file_cached(
+    path: Union[str, os.PathLike],
+    s1: Union[str, bytes, re.Pattern],
+    s2: Union[str, bytes, re.Pattern],
+    cache_dir: Optional[Union[str, os.PathLike]] = None,
+    str_regex: bool = False,
+    regex_pairing: str = "stack",
+    regex_key: Optional[str] = None,
+    encoding: str = "utf-8",
+    **options: Any,
+) -> PairColumns:
+    r"""
+    Parses a file into a PairColumns like parse_pairs(path, ..., result="columns"),
+    and saves the columns in cache_dir with save_columns. Later calls for the
+    same file and delimiters load them with load_columns instead of parsing.
+
+    The cache file is named after a hash of the absolute path, modification
+    time and size of the file, the delimiters and the options, so changing
+    the file or the delimiters parses it again. Old cache files are not
+    removed.
+
+    Args:
+        path: The file to parse. It is memory-mapped with map_file and is the text of the result.
+        s1, s2, str_regex, regex_key, encoding: See parse_pairs. regex_key must be a group name, a callable has no stable cache key.
+        cache_dir: Directory of the cache files, "__pfcache__" next to path by default.
+        regex_pairing (str): See parse_pairs. Defaults to "stack", the only regex pairing with a PairColumns result.
+        **options: max_matches, max_depth, outermost_only or innermost_only, see parse_pairs.
+
+    Returns:
+        PairColumns: The pairs of a single pair of delimiters.
+
+    Example:
+        from parifinder import parse_file_cached
+
+        columns = parse_file_cached("corpus/big.json", "{", "}")
+        print(len(columns), columns.node_text(0))
+    """
+    if callable(regex_key):
+        raise ValueError("regex_key must be a group name to cache the result")
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "__pfcache__")
+    stat = os.stat(path)
+    spec = _spec_key(s1, s2, str_regex, regex_pairing, regex_key, encoding)
+    digest = hashlib.blake2b(
+        repr(
+            (
+                os.path.abspath(path),
+                stat.st_mtime_ns,
+                stat.st_size,
+                spec,
+                sorted(options.items()),
+            )
+        ).encode("utf-8"),
+        digest_size=16,
+    ).hexdigest()
+    cached = os.path.join(cache_dir, f"{os.path.basename(path)}.{digest}.pfc")
+    text = map_file(path)
+    if os.path.exists(cached):
+        return load_columns(cached, text)
+    columns = compile(s1, s2, str_regex, regex_pairing, regex_key, encoding).parse(
+        text, result="columns", **options
+    )
+    if isinstance(columns, dict):
+        raise ValueError("parse_file_cached requires a single pair of delimiters")
+    os.makedirs(cache_dir, exist_ok=True)
+    save_columns(columns, cached)
+    return columns